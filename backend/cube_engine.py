@@ -1,90 +1,93 @@
+import os
+import re
+import secrets
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List
+
+import kociemba
 import numpy as np
-from fastapi import APIRouter, Request, HTTPException
-from kociemba import solve
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import BaseModel
+
+# Numba is not in requirements.txt: the JIT-compiled move kernel below only
+# activates when the operator installs it separately; otherwise moves use
+# NumPy's allocation-free np.take.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    from kociemba.ckociembawrapper import ffi as kociemba_ffi, lib as kociemba_lib
+except ImportError:  # Pure-Python kociemba build; go through its wrapper.
+    kociemba_ffi = kociemba_lib = None
 
 # --- Core Cube Logic & State Representation ---
 
 # Using integers for faces for internal representation.
 # U:0, R:1, F:2, D:3, L:4, B:5
-FACE_MAP = {
-    0: "U",
-    1: "R",
-    2: "F",
-    3: "D",
-    4: "L",
-    5: "B",
-}
-SOLVED_KOCIEMBA_STRING = "".join([f * 9 for f in "URFDLB"])
+FACE_TRANSLATION = bytes.maketrans(bytes(range(6)), b"URFDLB")
+PRISTINE_STATE = bytes(face_id for face_id in range(6) for _ in range(9))
+PRISTINE_CENTERS = PRISTINE_STATE[4::9]
+SOLVED_KOCIEMBA_BYTES = PRISTINE_STATE.translate(FACE_TRANSLATION)
+SOLVED_KOCIEMBA_STRING = SOLVED_KOCIEMBA_BYTES.decode("ascii")
 
+# Flat source indices of a 3x3 face rotated a quarter turn.
+FACE_CW_INDICES = np.array([[6, 3, 0], [7, 4, 1], [8, 5, 2]])
+FACE_CCW_INDICES = np.array([[2, 5, 8], [1, 4, 7], [0, 3, 6]])
 
-class Polyhedron:
+
+class _FaceletMatrix:
     """
-    Represents the state and operations of a 3x3x3 cube.
-    The internal representation uses a NumPy array and integer face identifiers.
+    Reference model of the cube as a 6x3x3 NumPy array.
+    Only used at import time to derive the move permutation tables below.
     """
 
     def __init__(self):
-        self.matrix = self._get_pristine_state()
+        self.matrix = np.arange(54, dtype=np.uint8).reshape(6, 3, 3)
         self._initialize_move_dispatcher()
 
-    def _get_pristine_state(self) -> np.array:
-        """Generates the matrix for a solved cube."""
-        return np.array(
-            [
-                [[face_id] * 3 for _ in range(3)]
-                for face_id in range(6)
-            ],
-            dtype=int
-        )
-
-    def to_kociemba_string(self) -> str:
-        """Converts the internal integer matrix to a Kociemba-compatible string."""
-        flat_array = self.matrix.flatten()
-        return "".join([FACE_MAP[face_id] for face_id in flat_array])
-
-    def reset_to_solved(self):
-        """Resets the cube to its initial, solved state."""
-        self.matrix = self._get_pristine_state()
-
     # --- Matrix Transformations (internal helpers) ---
 
     def _rotate_layer_clockwise(self, face_idx: int):
-        self.matrix[face_idx] = np.rot90(self.matrix[face_idx], -1)
+        self.matrix[face_idx] = self.matrix[face_idx].flat[FACE_CW_INDICES]
 
     def _rotate_layer_counter_clockwise(self, face_idx: int):
-        self.matrix[face_idx] = np.rot90(self.matrix[face_idx], 1)
+        self.matrix[face_idx] = self.matrix[face_idx].flat[FACE_CCW_INDICES]
 
     # --- Face Turn Implementations (private methods) ---
 
     def _turn_F_cw(self):
         self._rotate_layer_clockwise(2)
         temp = self.matrix[0][2, :].copy()
-        self.matrix[0][2, :] = np.flip(self.matrix[4][:, 2])
+        self.matrix[0][2, :] = self.matrix[4][:, 2][::-1]
         self.matrix[4][:, 2] = self.matrix[3][0, :]
-        self.matrix[3][0, :] = np.flip(self.matrix[1][:, 0])
+        self.matrix[3][0, :] = self.matrix[1][:, 0][::-1]
         self.matrix[1][:, 0] = temp
 
     def _turn_F_ccw(self):
         self._rotate_layer_counter_clockwise(2)
         temp = self.matrix[0][2, :].copy()
         self.matrix[0][2, :] = self.matrix[1][:, 0]
-        self.matrix[1][:, 0] = np.flip(self.matrix[3][0, :])
+        self.matrix[1][:, 0] = self.matrix[3][0, :][::-1]
         self.matrix[3][0, :] = self.matrix[4][:, 2]
-        self.matrix[4][:, 2] = np.flip(temp)
+        self.matrix[4][:, 2] = temp[::-1]
 
     def _turn_R_cw(self):
         self._rotate_layer_clockwise(1)
-        temp = np.flip(self.matrix[0][:, 2]).copy()
+        temp = self.matrix[0][:, 2][::-1].copy()
         self.matrix[0][:, 2] = self.matrix[2][:, 2]
         self.matrix[2][:, 2] = self.matrix[3][:, 2]
-        self.matrix[3][:, 2] = np.flip(self.matrix[5][:, 0])
+        self.matrix[3][:, 2] = self.matrix[5][:, 0][::-1]
         self.matrix[5][:, 0] = temp
 
     def _turn_R_ccw(self):
         self._rotate_layer_counter_clockwise(1)
         temp = self.matrix[0][:, 2].copy()
-        self.matrix[0][:, 2] = self.matrix[5][:, 0]
-        self.matrix[5][:, 0] = np.flip(self.matrix[3][:, 2])
+        self.matrix[0][:, 2] = self.matrix[5][:, 0][::-1]
+        self.matrix[5][:, 0] = self.matrix[3][:, 2][::-1]
         self.matrix[3][:, 2] = self.matrix[2][:, 2]
         self.matrix[2][:, 2] = temp
 
@@ -107,17 +110,17 @@ class Polyhedron:
     def _turn_L_cw(self):
         self._rotate_layer_clockwise(4)
         temp = self.matrix[0][:, 0].copy()
-        self.matrix[0][:, 0] = np.flip(self.matrix[5][:, 2])
-        self.matrix[5][:, 2] = np.flip(self.matrix[3][:, 0])
+        self.matrix[0][:, 0] = self.matrix[5][:, 2][::-1]
+        self.matrix[5][:, 2] = self.matrix[3][:, 0][::-1]
         self.matrix[3][:, 0] = self.matrix[2][:, 0]
         self.matrix[2][:, 0] = temp
 
     def _turn_L_ccw(self):
         self._rotate_layer_counter_clockwise(4)
-        temp = np.flip(self.matrix[0][:, 0]).copy()
+        temp = self.matrix[0][:, 0][::-1].copy()
         self.matrix[0][:, 0] = self.matrix[2][:, 0]
         self.matrix[2][:, 0] = self.matrix[3][:, 0]
-        self.matrix[3][:, 0] = np.flip(self.matrix[5][:, 2])
+        self.matrix[3][:, 0] = self.matrix[5][:, 2][::-1]
         self.matrix[5][:, 2] = temp
 
     def _turn_D_cw(self):
@@ -138,39 +141,47 @@ class Polyhedron:
 
     def _turn_B_cw(self):
         self._rotate_layer_clockwise(5)
-        temp = np.flip(self.matrix[0][0, :]).copy()
+        temp = self.matrix[0][0, :][::-1].copy()
         self.matrix[0][0, :] = self.matrix[1][:, 2]
-        self.matrix[1][:, 2] = np.flip(self.matrix[3][2, :])
+        self.matrix[1][:, 2] = self.matrix[3][2, :][::-1]
         self.matrix[3][2, :] = self.matrix[4][:, 0]
         self.matrix[4][:, 0] = temp
 
     def _turn_B_ccw(self):
         self._rotate_layer_counter_clockwise(5)
         temp = self.matrix[0][0, :].copy()
-        self.matrix[0][0, :] = np.flip(self.matrix[4][:, 0])
+        self.matrix[0][0, :] = self.matrix[4][:, 0][::-1]
         self.matrix[4][:, 0] = self.matrix[3][2, :]
-        self.matrix[3][2, :] = np.flip(self.matrix[1][:, 2])
+        self.matrix[3][2, :] = self.matrix[1][:, 2][::-1]
         self.matrix[1][:, 2] = temp
         
     def _orient_x_pos(self):
         temp = self.matrix[0].copy()
         self.matrix[0] = self.matrix[2]
         self.matrix[2] = self.matrix[3]
-        self.matrix[3] = np.flipud(self.matrix[5])
-        self.matrix[5] = np.flipud(temp)
+        self.matrix[3] = self.matrix[5][::-1, ::-1]
+        self.matrix[5] = temp[::-1, ::-1]
         self._rotate_layer_clockwise(1)
         self._rotate_layer_counter_clockwise(4)
 
     def _orient_x_neg(self):
         temp = self.matrix[0].copy()
-        self.matrix[0] = np.flipud(self.matrix[5])
-        self.matrix[5] = np.flipud(self.matrix[3])
+        self.matrix[0] = self.matrix[5][::-1, ::-1]
+        self.matrix[5] = self.matrix[3][::-1, ::-1]
         self.matrix[3] = self.matrix[2]
         self.matrix[2] = temp
         self._rotate_layer_counter_clockwise(1)
         self._rotate_layer_clockwise(4)
 
-    # --- Public Move Execution ---
+    def _turn_M_cw(self):
+        self._turn_R_ccw()
+        self._turn_L_cw()
+        self._orient_x_pos()
+
+    def _turn_M_ccw(self):
+        self._turn_R_cw()
+        self._turn_L_ccw()
+        self._orient_x_neg()
 
     def _initialize_move_dispatcher(self):
         """Initializes the mapping from move strings to methods."""
@@ -181,69 +192,330 @@ class Polyhedron:
             "L": self._turn_L_cw, "L'": self._turn_L_ccw,
             "D": self._turn_D_cw, "D'": self._turn_D_ccw,
             "B": self._turn_B_cw, "B'": self._turn_B_ccw,
-            "M": lambda: [self._turn_R_ccw(), self._turn_L_cw(), self._orient_x_pos()],
-            "M'": lambda: [self._turn_R_cw(), self._turn_L_ccw(), self._orient_x_neg()],
+            "M": self._turn_M_cw, "M'": self._turn_M_ccw,
         }
 
     def execute_manipulation(self, move_notation: str):
-        """Executes a single move notation (e.g., 'R', 'F'')."""
+        """Applies a single move notation to the reference matrix."""
         if move_notation not in self._move_dispatcher:
             raise ValueError(f"Unknown move notation: {move_notation}")
         self._move_dispatcher[move_notation]()
 
 
+def _build_move_permutations() -> dict:
+    """
+    Derives, for every move, the permutation perm such that the facelet at
+    position i after the move comes from position perm[i] before it.
+    """
+    permutations = {}
+    for move_notation in _FaceletMatrix()._move_dispatcher:
+        reference = _FaceletMatrix()
+        reference.execute_manipulation(move_notation)
+        permutations[move_notation] = np.frombuffer(
+            reference.matrix.tobytes(), dtype=np.uint8
+        )
+    # Double turns compose into a single gather; stored read-only like the
+    # others so every table shares one dtype/layout signature.
+    for face in "FRULDB":
+        permutations[face + "2"] = np.frombuffer(
+            permutations[face][permutations[face]].tobytes(), dtype=np.uint8
+        )
+    return permutations
+
+
+MOVE_PERMUTATIONS = _build_move_permutations()
+
+
+def _check_move_permutations(permutations: dict):
+    """
+    Guards the tables against mistakes in the reference model: every turn
+    must be undone by its inverse, and every double turn must equal the
+    quarter turn applied twice.
+    """
+    identity = np.arange(54)
+    for face in "FRULDBM":
+        turn, inverse = permutations[face], permutations[face + "'"]
+        if not (np.array_equal(turn[inverse], identity) and np.array_equal(inverse[turn], identity)):
+            raise RuntimeError(f"Move {face}' does not undo {face}")
+    for face in "FRULDB":
+        turn = permutations[face]
+        if not np.array_equal(permutations[face + "2"], turn[turn]):
+            raise RuntimeError(f"Move {face}2 is not {face} applied twice")
+
+
+_check_move_permutations(MOVE_PERMUTATIONS)
+
+
+def _gather_facelets(state: np.ndarray, permutation: np.ndarray, out: np.ndarray):
+    """Writes state permuted by permutation into the preallocated out array."""
+    np.take(state, permutation, out=out)
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _gather_facelets(state, permutation, out):
+        for i in range(54):
+            out[i] = state[permutation[i]]
+
+    # Compile up front so the first request does not pay the JIT latency. All
+    # permutation tables share this read-only uint8 signature, so one call
+    # covers every move.
+    _gather_facelets(
+        np.zeros(54, dtype=np.uint8), MOVE_PERMUTATIONS["F"], np.empty(54, dtype=np.uint8)
+    )
+
+
+class Polyhedron:
+    """
+    Represents the state and operations of a 3x3x3 cube.
+    The internal representation is a 54-byte bytearray of integer face
+    identifiers; moves are applied as precomputed permutations.
+    """
+
+    def __init__(self):
+        self.state = self._get_pristine_state()
+        self._facelets = np.frombuffer(self.state, dtype=np.uint8)
+        self._scratch = np.empty(54, dtype=np.uint8)
+        self._cached_bytes = SOLVED_KOCIEMBA_BYTES
+
+    def _get_pristine_state(self) -> bytearray:
+        """Returns a mutable copy of the solved cube's state."""
+        return bytearray(PRISTINE_STATE)
+
+    def to_kociemba_string(self) -> str:
+        """Converts the internal face identifiers to a Kociemba-compatible string."""
+        return self.to_kociemba_bytes().decode("ascii")
+
+    def to_kociemba_bytes(self) -> bytes:
+        """
+        Converts the internal face identifiers to an ASCII Kociemba facelet string.
+        Kociemba names each face after its center, so once M moves have shifted
+        the centers, facelets are relabelled by the current center colors.
+        The result is cached until the next move.
+        """
+        if self._cached_bytes is None:
+            centers = self.state[4::9]
+            if centers == PRISTINE_CENTERS:
+                translation = FACE_TRANSLATION
+            else:
+                translation = bytes.maketrans(centers, b"URFDLB")
+            self._cached_bytes = bytes(self.state.translate(translation))
+        return self._cached_bytes
+
+    def reset_to_solved(self):
+        """Resets the cube to its initial, solved state."""
+        self.state[:] = PRISTINE_STATE
+        self._cached_bytes = SOLVED_KOCIEMBA_BYTES
+
+    def execute_manipulation(self, move_notation: str):
+        """Executes a single move notation (e.g., 'R', 'F'', 'U2')."""
+        permutation = MOVE_PERMUTATIONS.get(move_notation)
+        if permutation is None:
+            raise ValueError(f"Unknown move notation: {move_notation}")
+        _gather_facelets(self._facelets, permutation, self._scratch)
+        self._facelets[:] = self._scratch
+        self._cached_bytes = None
+
+
+# --- Short Solution Lookup ---
+
+# States within this many face turns of solved are answered from a lookup
+# table instead of the full two-phase solver (~47K states, a few MB).
+SHORT_SOLUTION_DEPTH = 4
+FACE_TURNS = tuple(face + suffix for face in "URFDLB" for suffix in ("", "'", "2"))
+
+
+def _invert_move(move_notation: str) -> str:
+    """Returns the move that undoes the given face turn."""
+    if move_notation.endswith("'"):
+        return move_notation[0]
+    if move_notation.endswith("2"):
+        return move_notation
+    return move_notation + "'"
+
+
+@lru_cache(maxsize=None)
+def _get_short_solution_table() -> dict:
+    """
+    Breadth-first search from the solved cube over the face-turn permutations.
+    Maps the state bytes of every cube within SHORT_SOLUTION_DEPTH turns of
+    solved to a shortest move sequence that solves it.
+    """
+    table = {PRISTINE_STATE: ()}
+    frontier_states = np.frombuffer(PRISTINE_STATE, dtype=np.uint8).reshape(1, 54)
+    frontier_solutions = [()]
+    for _ in range(SHORT_SOLUTION_DEPTH):
+        next_states = []
+        next_solutions = []
+        for move_notation in FACE_TURNS:
+            undo = (_invert_move(move_notation),)
+            turned_states = frontier_states[:, MOVE_PERMUTATIONS[move_notation]]
+            for turned_state, solution in zip(turned_states, frontier_solutions):
+                key = turned_state.tobytes()
+                if key not in table:
+                    table[key] = undo + solution
+                    next_states.append(turned_state)
+                    next_solutions.append(table[key])
+        frontier_states = np.array(next_states, dtype=np.uint8)
+        frontier_solutions = next_solutions
+    return table
+
+
+# --- Solver Binding ---
+
+KOCIEMBA_CACHE_DIR = os.path.join(os.path.dirname(kociemba.__file__), "cprunetables").encode()
+KOCIEMBA_MAX_DEPTH = 24
+
+
+def _solve_facelets(cube: bytes) -> str:
+    """
+    Runs the two-phase solver on an ASCII facelet string, calling the C
+    library directly when the native kociemba build is installed.
+    """
+    if kociemba_lib is None:
+        return kociemba.solve(cube.decode("ascii"))
+    solution = kociemba_lib.solve(cube, kociemba_ffi.NULL, KOCIEMBA_CACHE_DIR, KOCIEMBA_MAX_DEPTH)
+    if solution == kociemba_ffi.NULL:
+        raise ValueError("Error. Probably cubestring is invalid")
+    return kociemba_ffi.string(solution).strip().decode("ascii")
+
+
+# Moves the centers (odd number of slice turns) so the relabelling path of
+# to_kociemba_bytes is exercised.
+ROUND_TRIP_SCRAMBLE = "M R U' M' F2 L D M B' U2"
+
+
+def _check_solver_round_trip():
+    """
+    Scrambles a cube with slice and face moves, solves it, and checks that it
+    comes back solved. Running it at import also loads the solver's tables
+    before the first request.
+    """
+    polyhedron = Polyhedron()
+    for move_notation in ROUND_TRIP_SCRAMBLE.split():
+        polyhedron.execute_manipulation(move_notation)
+    for move_notation in _solve_facelets(polyhedron.to_kociemba_bytes()).split():
+        polyhedron.execute_manipulation(move_notation)
+    if polyhedron.to_kociemba_string() != SOLVED_KOCIEMBA_STRING:
+        raise RuntimeError("Solving a scrambled cube did not return it to solved")
+
+
+_check_solver_round_trip()
+
+
 # --- API Layer ---
 
-# A single, global instance of our cube engine.
-polyhedron_engine_instance = Polyhedron()
+# One cube engine per browser session, keyed by a session cookie. Sessions
+# are kept in least-recently-used order so expired ones, and the oldest ones
+# beyond MAX_SESSIONS, can be evicted from the front. The store is per
+# process, so a session must always reach the same server process (sticky
+# sessions at the load balancer). Non-browser clients (scripts, curl) must
+# send back the cube_session cookie from their first response; without it
+# every request starts a fresh, solved cube.
+SESSION_COOKIE_NAME = "cube_session"
+# Production is served over HTTPS, so the cookie is never sent in plaintext there.
+SESSION_COOKIE_SECURE = os.getenv("ENV", "development") == "production"
+SESSION_TTL_SECONDS = 60 * 60
+MAX_SESSIONS = 10_000
+session_engines = OrderedDict()  # session id -> (Polyhedron, last seen)
+
+async def get_session_engine(request: Request, response: Response) -> Polyhedron:
+    """
+    Returns the cube engine for the caller's session, creating one if needed.
+    Declared async (with no awaits) so it runs on the event loop without
+    interruption rather than in FastAPI's thread pool, where concurrent
+    requests would race on session_engines.
+    """
+    now = time.monotonic()
+    while session_engines:
+        oldest_session_id, (_, last_seen) = next(iter(session_engines.items()))
+        if now - last_seen < SESSION_TTL_SECONDS:
+            break
+        del session_engines[oldest_session_id]
+
+    session_id = request.cookies.get(SESSION_COOKIE_NAME)
+    entry = session_engines.pop(session_id, None)
+    if entry is not None:
+        engine, _ = entry
+    else:
+        session_id = secrets.token_urlsafe(16)
+        engine = Polyhedron()
+        response.set_cookie(
+            SESSION_COOKIE_NAME, session_id,
+            max_age=SESSION_TTL_SECONDS, httponly=True, samesite="lax",
+            secure=SESSION_COOKIE_SECURE,
+        )
+    session_engines[session_id] = (engine, now)
+    while len(session_engines) > MAX_SESSIONS:
+        session_engines.popitem(last=False)
+    return engine
 
 # Renamed the router
 polyhedron_api_router = APIRouter()
 
+SOLUTION_TOKEN_PATTERN = re.compile(r"[URFDLB][2']?")
+
 def _tokenize_solution_string(solution_str: str) -> list:
     """Parses the Kociemba solver output into a list of moves."""
-    tokens = []
-    for move in solution_str.split():
-        if "2" in move:
-            base_move = move[0]
-            tokens.append([base_move, base_move])
-        else:
-            tokens.append(move)
-    return tokens
-
-@polyhedron_api_router.post("/move")
-async def process_manipulation(request: Request):
-    payload = await request.json()
-    move = payload.get("move")
-    if not move:
-        raise HTTPException(status_code=400, detail="Move not specified in payload.")
-    
+    return SOLUTION_TOKEN_PATTERN.findall(solution_str)
+
+class MovePayload(BaseModel):
+    move: str
+
+class MoveResult(BaseModel):
+    move: str
+    cube_string: str
+
+class SolutionResult(BaseModel):
+    solutionString: str
+    parsedMoves: List[str]
+
+@polyhedron_api_router.post("/move", response_model=MoveResult)
+async def process_manipulation(
+    payload: MovePayload,
+    response: Response,
+    polyhedron_engine_instance: Polyhedron = Depends(get_session_engine),
+):
     try:
-        polyhedron_engine_instance.execute_manipulation(move)
-        return {
-            "move": move,
-            "cube_string": polyhedron_engine_instance.to_kociemba_string(),
-        }
+        polyhedron_engine_instance.execute_manipulation(payload.move)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    # The body is assembled by hand to skip JSON encoding on the hottest
+    # endpoint. No escaping is needed: the move has just been validated against
+    # MOVE_PERMUTATIONS and the cube string only contains face letters.
+    # Headers set by dependencies (the session cookie) are carried over.
+    return Response(
+        content=b'{"move":"' + payload.move.encode("ascii")
+        + b'","cube_string":"' + polyhedron_engine_instance.to_kociemba_bytes() + b'"}',
+        media_type="application/json",
+        headers=response.headers,
+    )
 
 @polyhedron_api_router.get("/solve")
-async def discover_solution_path():
-    current_state_str = polyhedron_engine_instance.to_kociemba_string()
+async def discover_solution_path(
+    polyhedron_engine_instance: Polyhedron = Depends(get_session_engine),
+) -> SolutionResult:
+    current_state = polyhedron_engine_instance.to_kociemba_bytes()
+
+    if current_state == SOLVED_KOCIEMBA_BYTES:
+        return SolutionResult(solutionString="", parsedMoves=[])
 
-    if current_state_str == SOLVED_KOCIEMBA_STRING:
-        return {"solutionString": "", "parsedMoves": []}
+    short_solution = _get_short_solution_table().get(bytes(polyhedron_engine_instance.state))
+    if short_solution is not None:
+        return SolutionResult(solutionString=" ".join(short_solution), parsedMoves=list(short_solution))
     
     try:
-        solution_path = solve(current_state_str)
+        solution_path = _solve_facelets(current_state)
         move_sequence = _tokenize_solution_string(solution_path)
-        return {"solutionString": solution_path, "parsedMoves": move_sequence}
+        return SolutionResult(solutionString=solution_path, parsedMoves=move_sequence)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         raise HTTPException(status_code=500, detail="An internal error occurred during solving.")
 
 @polyhedron_api_router.post("/reset-cube")
-async def restore_pristine_state():
+async def restore_pristine_state(
+    polyhedron_engine_instance: Polyhedron = Depends(get_session_engine),
+):
     polyhedron_engine_instance.reset_to_solved()
     return {}
\ No newline at end of file
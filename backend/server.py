@@ -1,5 +1,4 @@
 import os
-import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from cube_engine import polyhedron_api_router
@@ -14,23 +13,34 @@ if deployment_profile == "production":
 else:
     allowed_origins = ["http://127.0.0.1:5500"]
 
-# Using renamed variables
-api_gateway.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Deployments whose reverse proxy already answers CORS can set
+# CORS_AT_PROXY=1 to drop the middleware from the request path.
+if os.getenv("CORS_AT_PROXY") != "1":
+    api_gateway.add_middleware(
+        CORSMiddleware,
+        allow_origins=allowed_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 # Using renamed router
 api_gateway.include_router(polyhedron_api_router)
 
 if __name__ == "__main__":
+    import uvicorn
+
     server_port = int(os.getenv("PORT", "8080"))
     
     # Using renamed variable
     if deployment_profile == "production":
-        uvicorn.run("server:api_gateway", host="0.0.0.0", port=server_port, workers=1)
+        # Cube sessions live in each worker's memory and uvicorn workers share
+        # one socket, so only raise this once sessions are stored externally;
+        # otherwise scale out with single-worker instances behind sticky sessions.
+        server_workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        uvicorn.run(
+            "server:api_gateway", host="0.0.0.0", port=server_port, workers=server_workers,
+            loop="uvloop", http="httptools",
+        )
     else:
         uvicorn.run("server:api_gateway", host="127.0.0.1", port=server_port, reload=True)
\ No newline at end of file
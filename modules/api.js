@@ -7,6 +7,7 @@ export async function postMove(move) {
     try {
         const response = await fetch(url + "/move", {
             method: "POST",
+            credentials: "include", // session cookie selects this browser's cube on the backend
             headers: {
                 "Content-Type": "application/json",
             },
@@ -28,6 +29,7 @@ export async function getSolution() {
     try {
         const response = await fetch(url + "/solve", {
             method: "GET",
+            credentials: "include",
             headers: {
                 "Content-Type": "application/json",
             },
@@ -44,7 +46,7 @@ export async function getSolution() {
 }
 
 export function resetBackendState() {
-    fetch(url + '/reset-cube', { method: 'POST' })
+    fetch(url + '/reset-cube', { method: 'POST', credentials: 'include' })
     .then(response => {
         if (!response.ok) {
             throw new Error("Failed to reset cube: " + response.statusText);
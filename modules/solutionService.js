@@ -9,8 +9,7 @@ async function handleSolve() {
     solutionDisplay.textContent = "";
 
     let data  = await getSolution();
-    let solutionMoves = data.solutionString.split(" "); // using notation from the kociemba solver, which includes double moves like "F2"
-    let parsedMoves = data.parsedMoves;
+    let parsedMoves = data.parsedMoves; // using notation from the kociemba solver, which includes double moves like "F2"
     console.log(data);
 
     let i = 0;
@@ -18,13 +17,13 @@ async function handleSolve() {
         if (parsedMoves.length === 0) return;
         if (i < parsedMoves.length) { // important to check against parsedMoves which can be empty.
             const move = parsedMoves[i];
-            if (typeof move === "string") { // single rotation
-                solutionDisplay.textContent += " " + solutionMoves[i];
-                await makeAutoMove(move, true);
-            } else if (Array.isArray(move) && move.length === 2) { // double rotations
-                solutionDisplay.textContent += " " + solutionMoves[i];
+            if (typeof move === "string" && move.endsWith("2")) { // double rotations
+                solutionDisplay.textContent += " " + move;
+                await makeAutoMove(move[0], true);
                 await makeAutoMove(move[0], true);
-                await makeAutoMove(move[1], true);
+            } else if (typeof move === "string") { // single rotation
+                solutionDisplay.textContent += " " + move;
+                await makeAutoMove(move, true);
             } else {
                 console.error("Unexpected move: ", move);
             }